@@ -1,5 +1,13 @@
+import contextlib
 import os
+import socket
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
 from fastapi import FastAPI
 from dotenv import load_dotenv
 
@@ -14,44 +22,114 @@ JIRA_EMAIL = os.getenv("JIRA_EMAIL")
 JIRA_API_TOKEN = os.getenv("JIRA_API_TOKEN")
 JIRA_ISSUE_KEY = os.getenv("JIRA_ISSUE_KEY")
 ATTACHMENT_DOWNLOAD_PATH = "./tmp"  # Always use ./tmp for local saving
+DOWNLOAD_WORKERS = int(os.getenv("JIRA_DL_PARALLEL", "8"))  # Parallel attachment downloads
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # Bytes per chunk when streaming attachments to disk
+ISSUE_URL = f"{JIRA_BASE_URL}/rest/api/3/issue/{JIRA_ISSUE_KEY}?fields=attachment"  # Attachment field only
 
+# HTTPAdapter that also enables TCP keepalive on top of urllib3's TCP_NODELAY default
+class KeepAliveAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        ]
+        super().init_poolmanager(*args, **kwargs)
+
+# Shared HTTP session so TCP/TLS connections to Jira are reused across requests
+SESSION = requests.Session()
+SESSION.auth = (JIRA_EMAIL, JIRA_API_TOKEN)
+SESSION.headers.update({"Accept": "application/json"})
+SESSION.mount("https://", KeepAliveAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    # raise_on_status=False hands the last 429/5xx response back to the status checks
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,
+    ),
+))
+
+# Last ETag and parsed body per URL, for If-None-Match revalidation
+_ETAGS = {}
+_LAST_BODY = {}
+
+# Download a single attachment to ./tmp and report the outcome
+def fetch_attachment(attachment):
+    filename = attachment["filename"]
+    content_url = attachment["content"]
+    filepath = os.path.join(ATTACHMENT_DOWNLOAD_PATH, filename)
+
+    # Stream into a per-call temp file so a failed download never clobbers an
+    # existing copy and concurrent downloads never share a partial file
+    part_path = None
+
+    try:
+        # Stream to disk in chunks instead of buffering the whole file in memory
+        with SESSION.get(content_url, stream=True) as file_response:
+            if file_response.status_code != 200:
+                return f"Failed to download {filename}: HTTP {file_response.status_code}"
+            fd, part_path = tempfile.mkstemp(dir=ATTACHMENT_DOWNLOAD_PATH, prefix=".", suffix=".part")
+            with os.fdopen(fd, "wb") as f:
+                for chunk in file_response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        os.replace(part_path, filepath)
+        return f"Saved to: {filepath}"
+    except Exception as e:
+        if part_path is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(part_path)
+        return f"Error downloading {filename}: {str(e)}"
+
+# Plain def: FastAPI runs it in its threadpool, so overlapping POSTs download
+# concurrently. They stay safe because fetch_attachment writes to a unique temp
+# file and publishes it with an atomic os.replace (last complete copy wins).
 @app.post("/")
-async def download_attachments():
+def download_attachments():
     # Ensure variables are present
     if not all([JIRA_BASE_URL, JIRA_EMAIL, JIRA_API_TOKEN, JIRA_ISSUE_KEY]):
         return {"error": "Missing required environment variables."}
 
-    # Ensure ./tmp exists
-    os.makedirs(ATTACHMENT_DOWNLOAD_PATH, exist_ok=True)
-
-    # Jira API auth and issue URL
-    auth = (JIRA_EMAIL, JIRA_API_TOKEN)
-    issue_url = f"{JIRA_BASE_URL}/rest/api/3/issue/{JIRA_ISSUE_KEY}"
-
-    # Fetch issue
-    response = requests.get(issue_url, auth=auth)
-    if response.status_code != 200:
+    # Fetch issue, revalidating with the last ETag so an unchanged issue
+    # comes back as an empty 304 and skips the JSON parse
+    headers = {"If-None-Match": _ETAGS[ISSUE_URL]} if ISSUE_URL in _ETAGS else {}
+    response = SESSION.get(ISSUE_URL, headers=headers)
+    if response.status_code == 304:
+        issue_data = _LAST_BODY[ISSUE_URL]
+    elif response.status_code != 200:
         return {"error": f"Failed to fetch issue. Status {response.status_code}", "details": response.text}
+    else:
+        issue_data = orjson.loads(response.content)
+        etag = response.headers.get("ETag")
+        if etag:
+            _LAST_BODY[ISSUE_URL] = issue_data
+            _ETAGS[ISSUE_URL] = etag
 
-    issue_data = response.json()
     attachments = issue_data["fields"].get("attachment", [])
     results = []
 
-    # Download each attachment to ./tmp
-    for attachment in attachments:
-        filename = attachment["filename"]
-        content_url = attachment["content"]
-        filepath = os.path.join(ATTACHMENT_DOWNLOAD_PATH, filename)
-
-        try:
-            file_response = requests.get(content_url, auth=auth)
-            if file_response.status_code == 200:
-                with open(filepath, "wb") as f:
-                    f.write(file_response.content)
-                results.append(f"Saved to: {filepath}")
+    # Index by filename so each local path is written by a single worker;
+    # like the previous serial loop, the last attachment with a given name wins
+    by_name = {attachment["filename"]: attachment for attachment in attachments}
+    if not by_name:
+        return {"results": results}
+
+    # Ensure ./tmp exists
+    os.makedirs(ATTACHMENT_DOWNLOAD_PATH, exist_ok=True)
+
+    # Download attachments to ./tmp in parallel; earlier attachments shadowed by
+    # a later one with the same name are skipped, not downloaded
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        futures = [
+            executor.submit(fetch_attachment, attachment)
+            if by_name[attachment["filename"]] is attachment else None
+            for attachment in attachments
+        ]
+        # One result per attachment, in the issue's attachment order
+        for attachment, future in zip(attachments, futures):
+            if future is None:
+                results.append(f"Skipped duplicate {attachment['filename']}")
             else:
-                results.append(f"Failed to download {filename}: HTTP {file_response.status_code}")
-        except Exception as e:
-            results.append(f"Error downloading {filename}: {str(e)}")
+                results.append(future.result())
 
     return {"results": results}